@@ -7,23 +7,38 @@ Clan Helper Bot - Beta 2 (deploy-ready)
 - Uses Supabase as DB backend.
 - Conversation flow in private: guser -> race (inline) -> atk (numeric keyboard) -> def (numeric keyboard) -> confirm -> upsert.
 - Timeout: 180 seconds (3 minutes).
-- Commands: start/act/me/atk/def/member/memberlist/delist/war/warlessa/warlessd/endwar/sync_members/allgato/allperro/allrana/cancel/cancelall/getcom
+- Commands: start/act/me/atk/def/liveboard/member/memberlist/delist/war/warlessa/warlessd/endwar/export/import/profile/sync_members/allgato/allperro/allrana/cancel/cancelall/getcom
 - Environment variables required: BOT_TOKEN, SUPABASE_URL, SUPABASE_KEY
+- Optional: ADMIN_TOKEN (enables admin HTTP routes GET /export and POST /profile, sent as X-Admin-Token)
 """
 
 import os
 import logging
 import re
+import time
+import asyncio
+import csv
+import io
+import json
+import secrets
+import sys
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
 from datetime import datetime, timedelta
-from typing import Optional, Any, Dict, List, Tuple
+from typing import Optional, Any, Dict, List, Tuple, Iterator, AsyncIterator, Callable
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse
 import uvicorn
 
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
     ReplyKeyboardMarkup, ReplyKeyboardRemove
 )
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -37,6 +52,7 @@ from telegram.ext import (
 )
 
 from supabase import create_client
+from cachetools import TTLCache
 
 # ---------- Logging ----------
 logging.basicConfig(level=logging.INFO)
@@ -46,6 +62,7 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv("BOT_TOKEN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # protects admin HTTP routes (/export, /profile)
 
 if not TOKEN:
     logger.warning("BOT_TOKEN not set in environment.")
@@ -59,23 +76,37 @@ else:
 # ---------- Conversation states & settings ----------
 ASK_GUSER, ASK_RACE, ASK_ATK, ASK_DEF, CONFIRM = range(5)
 TIMEOUT_SECONDS = 180  # 3 minutes
+CALLBACK_DEBOUNCE_SECONDS = 2.0
+DELIST_PAGE_SIZE = 5
+DELIST_SESSION_TTL = 600  # seconds an idle /delist menu stays usable
+DELIST_MAX_SESSIONS = 128
+PAGE_SIZE = 500  # rows per keyset-paginated read
+IMPORT_MAX_BYTES = 1 << 20
+IMPORT_MAX_REPORT = 30  # error lines shown in the /import reply
+IMPORT_MAX_NAME = 40  # chars of a user-supplied guser echoed per error line
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_TOP_UPDATES = 10
+PROFILE_NOTE = "event-loop thread only, while an update is processed; idle select() frames dropped"
+LEADERBOARD_DEBOUNCE_SECONDS = 10
+LEADERBOARD_TOP = 20
 
 # ---------- Utilities ----------
+POWER_RE = re.compile(r"(\d+(?:\.\d+)?)([km]?)")
+POWER_MULT = {"": 1, "k": 1_000, "m": 1_000_000}
+
+def parse_powers(texts: List[Any]) -> List[Optional[int]]:
+    """Bulk parse_power: parse many values with one compiled regex."""
+    out: List[Optional[int]] = []
+    match = POWER_RE.fullmatch
+    for text in texts:
+        m = match(text.strip().lower().replace(",", "")) if isinstance(text, str) else None
+        out.append(int(float(m.group(1)) * POWER_MULT[m.group(2)]) if m else None)
+    return out
+
 def parse_power(text: str) -> Optional[int]:
     """Parse strings like '34k', '1.5m', '1200' -> int or None."""
-    if not isinstance(text, str):
-        return None
-    t = text.strip().lower().replace(",", "")
-    m = re.fullmatch(r"(\d+(?:\.\d+)?)([km]?)", t)
-    if not m:
-        return None
-    num = float(m.group(1))
-    suf = m.group(2)
-    if suf == "k":
-        num *= 1_000
-    elif suf == "m":
-        num *= 1_000_000
-    return int(num)
+    return parse_powers([text])[0]
 
 def build_num_keyboard() -> ReplyKeyboardMarkup:
     kb = [
@@ -87,6 +118,58 @@ def build_num_keyboard() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(kb, resize_keyboard=True, one_time_keyboard=False)
 
+def fetch_page(table: str, columns: str, after: Optional[str] = None,
+               page_size: int = PAGE_SIZE, where: Optional[Callable[[Any], Any]] = None,
+               before: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Fetch one page of `table` ordered by uid, starting after uid `after`
+    (or the page ending just before uid `before`, for paging backwards).
+
+    `columns` is pushed down to the select (uid is always included for the
+    keyset); `where` receives the query builder to add filters (eq, or_, ...).
+    """
+    if not supabase:
+        return []
+    cols = columns if "uid" in columns.split(",") else "uid," + columns
+    q = supabase.table(table).select(cols)
+    if where:
+        q = where(q)
+    if before is not None:
+        res = q.lt("uid", before).order("uid", desc=True).limit(page_size).execute()
+        return list(reversed(res.data)) if res and getattr(res, "data", None) else []
+    if after is not None:
+        q = q.gt("uid", after)
+    res = q.order("uid").limit(page_size).execute()
+    return res.data if res and getattr(res, "data", None) else []
+
+def iter_table(table: str, columns: str, page_size: int = PAGE_SIZE,
+               where: Optional[Callable[[Any], Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Yield all rows of `table` ordered by uid, reading keyset-paginated pages.
+
+    Avoids PostgREST's silent row cap on a plain select() and never holds
+    more than one page in memory.
+    """
+    after = None
+    while True:
+        rows = fetch_page(table, columns, after, page_size, where)
+        # stop only on an empty page: PostgREST's max-rows may cap a page
+        # below page_size, so a short page does not mean the end
+        if not rows:
+            return
+        yield from rows
+        after = rows[-1]["uid"]
+
+async def aiter_table(table: str, columns: str, page_size: int = PAGE_SIZE,
+                      where: Optional[Callable[[Any], Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Async version of iter_table; each page is fetched off the event loop."""
+    after = None
+    while True:
+        rows = await asyncio.to_thread(fetch_page, table, columns, after, page_size, where)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        after = rows[-1]["uid"]
+
 def get_group_id() -> Optional[int]:
     """Read settings.group_id from supabase settings table if present."""
     try:
@@ -99,6 +182,40 @@ def get_group_id() -> Optional[int]:
         logger.exception("Error reading group_id")
     return None
 
+# War participation is tracked by epoch: settings.war_epoch is the current war
+# number and users.war_epoch is the last war in which the user sent troops.
+# "Not sent" means users.war_epoch < current (or NULL), so ending a war only
+# bumps the counter instead of rewriting every row in users.
+# Requires: users.war_epoch integer (indexed), and settings.key unique so the
+# upserts below (on_conflict="key") update the row instead of adding another.
+_war_epoch: Optional[int] = None
+
+def get_war_epoch() -> int:
+    """Read settings.war_epoch from supabase settings table (0 if the row is missing).
+
+    The value is cached in process; bump_war_epoch keeps the cache in sync.
+    Read errors propagate: falling back to 0 would make bump_war_epoch
+    overwrite the real counter and war_callback record the wrong war.
+    """
+    global _war_epoch
+    if _war_epoch is not None:
+        return _war_epoch
+    if not supabase:
+        return 0
+    res = supabase.table("settings").select("value").eq("key", "war_epoch").execute()
+    _war_epoch = int(res.data[0]["value"]) if res and getattr(res, "data", None) else 0
+    return _war_epoch
+
+def bump_war_epoch() -> int:
+    """Advance the war epoch by one and return the new value."""
+    global _war_epoch
+    _war_epoch = None
+    epoch = get_war_epoch() + 1
+    if supabase:
+        supabase.table("settings").upsert({"key": "war_epoch", "value": str(epoch)}, on_conflict="key").execute()
+    _war_epoch = epoch
+    return epoch
+
 async def belongs_to_clan(bot, user_id: int) -> bool:
     gid = get_group_id()
     if not gid:
@@ -125,6 +242,60 @@ def expired(context: ContextTypes.DEFAULT_TYPE) -> bool:
         return True
     return (datetime.utcnow() - started).total_seconds() > TIMEOUT_SECONDS
 
+# ---------- Callback queries ----------
+_recent_callbacks: Dict[Tuple[int, str], float] = {}
+_callback_answer: ContextVar[Optional[str]] = ContextVar("callback_answer", default=None)
+
+def set_callback_answer(text: Optional[str]):
+    """Override the answer text of the callback query being handled."""
+    _callback_answer.set(text)
+
+def debounced_callback(answer_text: Optional[str] = None):
+    """Decorator for CallbackQuery handlers.
+
+    Answers every query exactly once and drops repeated taps of the same
+    button by the same user within CALLBACK_DEBOUNCE_SECONDS, so button
+    storms cost a single DB write/edit. The answer is sent after the handler
+    returns, with answer_text unless the handler called set_callback_answer;
+    dropped repeats are answered with answer_text right away.
+    Wrapped handlers must not call query.answer() themselves.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            query = update.callback_query
+            if not query:
+                return await handler(update, context)
+            now = time.monotonic()
+            if len(_recent_callbacks) > 1024:
+                for k in [k for k, t in _recent_callbacks.items() if now - t > CALLBACK_DEBOUNCE_SECONDS]:
+                    del _recent_callbacks[k]
+            key = (query.from_user.id, query.data or "")
+            last = _recent_callbacks.get(key)
+            _recent_callbacks[key] = now
+            if last is not None and now - last < CALLBACK_DEBOUNCE_SECONDS:
+                await answer_callback(query, answer_text)
+                return None
+            token = _callback_answer.set(answer_text)
+            try:
+                result = await handler(update, context)
+            except Exception:
+                _callback_answer.set("❌ Error, inténtalo de nuevo")
+                raise
+            finally:
+                text = _callback_answer.get()
+                _callback_answer.reset(token)
+                await answer_callback(query, text)
+            return result
+        return wrapper
+    return decorator
+
+async def answer_callback(query, text: Optional[str]):
+    try:
+        await query.answer(text)
+    except Exception:
+        logger.debug("Could not answer callback query %s", query.id)
+
 # ---------- Handlers: start / registration flow ----------
 async def start_group_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """When /start is used in group — invite user to PM the bot."""
@@ -204,11 +375,11 @@ async def get_guser(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🏹 Selecciona tu RAZA:", reply_markup=kb)
     return ASK_RACE
 
+@debounced_callback()
 async def get_race(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     if not query:
         return ConversationHandler.END
-    await query.answer()
     if expired(context):
         await query.edit_message_text("⏱️ Tiempo agotado. Usa /start nuevamente.")
         context.user_data.clear()
@@ -272,7 +443,6 @@ async def get_def(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 supabase.table("users").update({
                     "atk": context.user_data["atk"],
                     "def": defense,
-                    "sent_war": False
                 }).eq("uid", uid).execute()
                 user_res = supabase.table("users").select("*").eq("uid", uid).execute()
                 user_data = user_res.data[0] if user_res and getattr(user_res, "data", None) else None
@@ -298,7 +468,6 @@ async def get_def(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     "race": context.user_data.get("race"),
                     "atk": context.user_data.get("atk"),
                     "def": defense,
-                    "sent_war": False
                 }).execute()
                 # upsert into members
                 try:
@@ -327,6 +496,7 @@ async def get_def(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Error al guardar. Inténtalo de nuevo.", reply_markup=ReplyKeyboardRemove())
         return ASK_DEF
 
+    request_leaderboard_refresh(context)
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -345,18 +515,21 @@ async def cancelall(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("⚠️ Todos los procesos activos de los usuarios han sido cancelados.")
 
 # ---------- Show power (rankings) ----------
-async def show_power(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str):
-    try:
-        users_res = supabase.table("users").select("*").execute() if supabase else None
-        users = users_res.data if users_res and getattr(users_res, "data", None) else []
-    except Exception:
-        users = []
+def render_power(users: List[Dict[str, Any]], key: str, limit: Optional[int] = None) -> str:
     users = [u for u in users if u.get(key)]
     users.sort(key=lambda u: u.get(key, 0), reverse=True)
     icon = "⚔️" if key == "atk" else "🛡"
     total = sum(u.get(key, 0) for u in users)
-    lines = [f"🎮 {u.get('guser', u.get('uid'))}\n└ {icon} {u.get(key):,}" for u in users]
-    msg = f"{icon} PODER DEL CLAN\n\n" + "\n\n".join(lines) + f"\n\n🔥 TOTAL: {total:,}"
+    lines = [f"🎮 {u.get('guser', u.get('uid'))}\n└ {icon} {u.get(key):,}" for u in users[:limit]]
+    return f"{icon} PODER DEL CLAN\n\n" + "\n\n".join(lines) + f"\n\n🔥 TOTAL: {total:,}"
+
+async def show_power(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str):
+    try:
+        users = [u async for u in aiter_table("users", f"guser,{key}", where=lambda q: q.gt(key, 0))]
+    except Exception:
+        logger.exception("Error leyendo ranking de %s", key)
+        users = []
+    msg = render_power(users, key)
     if update.message:
         await update.message.reply_text(msg)
     elif update.callback_query:
@@ -368,6 +541,95 @@ async def cmd_atk(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_def(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_power(update, context, "def")
 
+# ---------- Live leaderboard ----------
+# Opt-in pinned message edited in place. Stat changes call
+# request_leaderboard_refresh, which schedules a single job per
+# LEADERBOARD_DEBOUNCE_SECONDS window; the job re-renders once and only edits
+# the message if the text differs from what was last sent.
+_leaderboard_text: Optional[str] = None
+
+def get_leaderboard_target() -> Optional[Tuple[int, int]]:
+    """Read settings.leaderboard ("chat_id:message_id") if enabled."""
+    try:
+        if not supabase:
+            return None
+        res = supabase.table("settings").select("value").eq("key", "leaderboard").execute()
+        if res and getattr(res, "data", None) and res.data[0]["value"]:
+            chat_id, message_id = res.data[0]["value"].split(":")
+            return int(chat_id), int(message_id)
+    except Exception:
+        logger.exception("Error reading leaderboard target")
+    return None
+
+def set_leaderboard_target(target: Optional[Tuple[int, int]]):
+    value = f"{target[0]}:{target[1]}" if target else ""
+    if supabase:
+        supabase.table("settings").upsert({"key": "leaderboard", "value": value}, on_conflict="key").execute()
+
+async def render_leaderboard() -> str:
+    users = [u async for u in aiter_table("users", "guser,atk,def")]
+    text = render_power(users, "atk", LEADERBOARD_TOP) + "\n\n" + render_power(users, "def", LEADERBOARD_TOP)
+    return text[:4096]
+
+def request_leaderboard_refresh(context: ContextTypes.DEFAULT_TYPE):
+    """Coalesce stat changes into one leaderboard edit per debounce window."""
+    jq = context.job_queue
+    if not jq:
+        logger.warning("JobQueue not available (install python-telegram-bot[job-queue]); leaderboard not refreshed")
+        return
+    if jq.get_jobs_by_name("leaderboard"):
+        return
+    jq.run_once(job_refresh_leaderboard, LEADERBOARD_DEBOUNCE_SECONDS, name="leaderboard")
+
+async def job_refresh_leaderboard(context: ContextTypes.DEFAULT_TYPE):
+    global _leaderboard_text
+    target = await asyncio.to_thread(get_leaderboard_target)
+    if not target:
+        return
+    try:
+        text = await render_leaderboard()
+        if text == _leaderboard_text:
+            return
+        try:
+            await context.bot.edit_message_text(text, chat_id=target[0], message_id=target[1])
+        except BadRequest as e:
+            # after a restart the cache is empty and the pinned text may already match
+            if "not modified" not in str(e).lower():
+                raise
+        _leaderboard_text = text
+    except Exception:
+        logger.exception("Error actualizando leaderboard")
+
+async def cmd_liveboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global _leaderboard_text
+    if not await is_admin(context.bot, update.effective_user.id):
+        await update.message.reply_text("🚫 Solo admins.")
+        return
+    arg = context.args[0].lower() if context.args else ""
+    if arg not in ("on", "off"):
+        await update.message.reply_text("❌ Usa /liveboard on|off")
+        return
+    old = get_leaderboard_target()
+    if old:
+        try:
+            await context.bot.unpin_chat_message(old[0], message_id=old[1])
+        except Exception:
+            logger.warning("No se pudo desfijar el leaderboard anterior")
+    _leaderboard_text = None
+    if arg == "off":
+        set_leaderboard_target(None)
+        await update.message.reply_text("✅ Leaderboard en vivo desactivado.")
+        return
+    gid = get_group_id() or update.effective_chat.id
+    text = await render_leaderboard()
+    msg = await context.bot.send_message(gid, text)
+    try:
+        await context.bot.pin_chat_message(gid, msg.message_id, disable_notification=True)
+    except Exception:
+        logger.warning("No se pudo fijar el leaderboard")
+    set_leaderboard_target((gid, msg.message_id))
+    _leaderboard_text = text
+
 # ---------- /me ----------
 async def cmd_me(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = str(update.effective_user.id)
@@ -417,8 +679,7 @@ async def cmd_memberlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_admin(context.bot, update.effective_user.id):
         await update.message.reply_text("🚫 Solo admins.")
         return
-    members_res = supabase.table("members").select("*").eq("registered", False).execute() if supabase else None
-    members = members_res.data if members_res and getattr(members_res, "data", None) else []
+    members = [m async for m in aiter_table("members", "tg", where=lambda q: q.eq("registered", False))]
     if not members:
         await update.message.reply_text("✅ Todos los miembros están registrados.")
         return
@@ -437,36 +698,48 @@ async def cmd_memberlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(msg)
 
 # ---------- Delist (interactive) ----------
+# One compact session per admin: page number, keyset bounds of the visible
+# page, whether a next page exists and the selected uid. Sessions live in a
+# size-bounded TTL/LRU cache, so abandoned menus are evicted automatically.
+_delist_sessions: TTLCache = TTLCache(maxsize=DELIST_MAX_SESSIONS, ttl=DELIST_SESSION_TTL)
+
 async def cmd_delist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_admin(context.bot, update.effective_user.id):
         await update.message.reply_text("🚫 Solo admins.")
         return
-    members_res = supabase.table("members").select("*").execute() if supabase else None
-    members = members_res.data if members_res and getattr(members_res, "data", None) else []
-    if not members:
+    session = {"page": 0, "first": None, "last": None, "has_next": False, "uid": None}
+    if not await send_delist_page(update, context, session):
         await update.message.reply_text("❌ No hay miembros.")
         return
-    context.user_data["delist_members"] = members
-    context.user_data["delist_page"] = 0
-    await send_delist_page(update, context)
-
-async def send_delist_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    members = context.user_data.get("delist_members", [])
-    page = context.user_data.get("delist_page", 0)
-    per_page = 5
-    start = page * per_page
-    end = start + per_page
-    page_members = members[start:end]
+    _delist_sessions[update.effective_user.id] = session
+
+async def send_delist_page(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Dict[str, Any],
+                           after: Optional[str] = None, before: Optional[str] = None) -> bool:
+    per_page = DELIST_PAGE_SIZE
+    page_members = await asyncio.to_thread(fetch_page, "members", "tg", after, per_page, None, before)
+    if not page_members:
+        return False
+    session["first"] = page_members[0]["uid"]
+    session["last"] = page_members[-1]["uid"]
+    # probe past the last uid rather than trusting the page length, which
+    # the server's row cap can shorten
+    session["has_next"] = before is not None or bool(
+        await asyncio.to_thread(fetch_page, "members", "uid", session["last"], 1)
+    )
+    page = session["page"]
+    users_by_uid: Dict[str, Dict[str, Any]] = {}
+    try:
+        uids = [m["uid"] for m in page_members]
+        user_res = supabase.table("users").select("uid,guser,tg").in_("uid", uids).execute() if supabase else None
+        if user_res and getattr(user_res, "data", None):
+            users_by_uid = {u["uid"]: u for u in user_res.data}
+    except Exception:
+        logger.exception("Error leyendo nombres para delist")
     kb = []
     names = []
     for m in page_members:
         uid = m.get("uid")
-        user_data = None
-        try:
-            user_res = supabase.table("users").select("guser,tg").eq("uid", uid).execute() if supabase else None
-            user_data = user_res.data[0] if user_res and getattr(user_res, "data", None) else None
-        except Exception:
-            user_data = None
+        user_data = users_by_uid.get(uid)
         if user_data and user_data.get("guser"):
             name = user_data.get("guser")
         elif m.get("tg"):
@@ -480,7 +753,7 @@ async def send_delist_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     nav = []
     if page > 0:
         nav.append(InlineKeyboardButton("⬅️ Anterior", callback_data="delist_prev"))
-    if end < len(members):
+    if session["has_next"]:
         nav.append(InlineKeyboardButton("Siguiente ➡️", callback_data="delist_next"))
     if nav:
         kb.append(nav)
@@ -490,27 +763,42 @@ async def send_delist_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.callback_query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup(kb))
     else:
         await update.message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb))
+    return True
 
+@debounced_callback()
 async def delist_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     data = query.data
+    admin_id = query.from_user.id
+    session = _delist_sessions.get(admin_id)
     if data == "delist_cancel":
-        context.user_data.pop("delist_members", None)
-        context.user_data.pop("delist_page", None)
+        _delist_sessions.pop(admin_id, None)
         await query.edit_message_text("❌ Delist cancelado.")
         return
-    elif data == "delist_prev":
-        context.user_data["delist_page"] = max(0, context.user_data.get("delist_page", 0) - 1)
-        await send_delist_page(update, context)
+    if session is None:
+        await query.edit_message_text("⌛ Sesión expirada. Usa /delist de nuevo.")
+        return
+    # re-insert to refresh the TTL on every interaction
+    _delist_sessions[admin_id] = session
+    if data == "delist_prev":
+        if session["page"] <= 0:
+            return
+        session["page"] -= 1
+        if not await send_delist_page(update, context, session, before=session["first"]):
+            session["page"] = 0
+            await send_delist_page(update, context, session)
         return
     elif data == "delist_next":
-        context.user_data["delist_page"] = context.user_data.get("delist_page", 0) + 1
-        await send_delist_page(update, context)
+        if not session["has_next"]:
+            return
+        session["page"] += 1
+        if not await send_delist_page(update, context, session, after=session["last"]):
+            session["page"] -= 1
+            session["has_next"] = False
         return
     elif data.startswith("delist_select_"):
         uid = data.split("delist_select_")[-1]
-        context.user_data["delist_uid"] = uid
+        session["uid"] = uid
         kb = InlineKeyboardMarkup([
             [InlineKeyboardButton("✅ Confirmar", callback_data="delist_confirm")],
             [InlineKeyboardButton("❌ Cancelar", callback_data="delist_cancel")],
@@ -518,7 +806,9 @@ async def delist_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(f"¿Expulsar a {uid}? Esto borrará sus datos.", reply_markup=kb)
         return
     elif data == "delist_confirm":
-        uid = context.user_data.get("delist_uid")
+        uid = session.get("uid")
+        if not uid:
+            return
         gid = get_group_id()
         if gid:
             try:
@@ -531,9 +821,8 @@ async def delist_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             supabase.table("members").delete().eq("uid", uid).execute() if supabase else None
         except Exception:
             logger.exception("Error borrando usuario %s de la BD", uid)
-        context.user_data.pop("delist_members", None)
-        context.user_data.pop("delist_page", None)
-        context.user_data.pop("delist_uid", None)
+        request_leaderboard_refresh(context)
+        _delist_sessions.pop(admin_id, None)
         await query.edit_message_text("✅ Usuario expulsado y datos borrados.")
         return
 
@@ -595,23 +884,33 @@ async def cmd_war(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.job_queue.run_once(job_send_message, when, data={"gid": gid, "msg": msg, "kb": kb})
     context.job_queue.run_once(job_send_message, remaining_seconds, data={"gid": gid, "msg": "🏁 La guerra ha terminado. ¡Gracias a todos por participar!", "kb": None})
 
+_war_sent: Dict[str, int] = {}
+
+@debounced_callback("✅ Tropas enviadas")
 async def war_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     uid = str(query.from_user.id)
     try:
-        supabase.table("users").update({"send": True, "sent_war": True}).eq("uid", uid).execute() if supabase else None
+        epoch = get_war_epoch()
+        if _war_sent.get(uid) == epoch:
+            return
+        if supabase:
+            supabase.table("users").update({"send": True, "war_epoch": epoch}).eq("uid", uid).execute()
+        _war_sent[uid] = epoch
     except Exception:
         logger.exception("Error marcando send en BD para %s", uid)
-    await query.answer("✅ Tropas enviadas")
+        set_callback_answer("❌ Error, inténtalo de nuevo")
 
 async def warless_calc(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, emoji: str):
+    total = 0
     try:
-        users_res = supabase.table("users").select("*").eq("sent_war", False).execute() if supabase else None
-        users = users_res.data if users_res and getattr(users_res, "data", None) else []
+        epoch = get_war_epoch()
+        async for u in aiter_table("users", key, where=lambda q: q.or_(f"war_epoch.is.null,war_epoch.lt.{epoch}")):
+            total += u.get(key) or 0
     except Exception:
-        users = []
-    total = sum(u.get(key, 0) for u in users if u.get(key))
+        logger.exception("Error calculando poder restante")
+        await update.message.reply_text("❌ Error al calcular el poder restante.")
+        return
     await update.message.reply_text(f"{emoji} Restante: {total:,}")
 
 async def cmd_warlessa(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -625,9 +924,11 @@ async def cmd_endwar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🚫 Solo admins.")
         return
     try:
-        supabase.table("users").update({"sent_war": False}).neq("uid", "").execute() if supabase else None
+        bump_war_epoch()
     except Exception:
-        logger.exception("Error reseteando sent_war")
+        logger.exception("Error avanzando war_epoch")
+        await update.message.reply_text("❌ Error al finalizar la guerra. Inténtalo de nuevo.")
+        return
     await update.message.reply_text("🏁 Guerra finalizada.")
 
 # ---------- Sync Members ----------
@@ -639,14 +940,363 @@ async def cmd_sync_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not gid:
         await update.message.reply_text("❌ Grupo no configurado.")
         return
-    members_res = supabase.table("members").select("*").eq("registered", False).execute() if supabase else None
-    members = members_res.data if members_res and getattr(members_res, "data", None) else []
+    members = [m async for m in aiter_table("members", "uid", where=lambda q: q.eq("registered", False))]
     if not members:
         await update.message.reply_text("✅ Todos los miembros están registrados.")
         return
     msg = "👥 Miembros no registrados:\n" + "\n".join([f"- {m['uid']}" for m in members])
     await update.message.reply_text(msg)
 
+# ---------- Export ----------
+EXPORT_FIELDS = ["uid", "tg", "guser", "race", "atk", "def", "sent_war"]
+
+def iter_roster(epoch: int) -> Iterator[Dict[str, Any]]:
+    for u in iter_table("users", "uid,tg,guser,race,atk,def,war_epoch"):
+        row = {f: u.get(f) for f in EXPORT_FIELDS if f != "sent_war"}
+        row["sent_war"] = u.get("war_epoch") is not None and u["war_epoch"] >= epoch
+        yield row
+
+def csv_safe(value: Any) -> Any:
+    """Neutralise spreadsheet formulas in free-text cells (e.g. guser)."""
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
+
+def iter_roster_export(fmt: str, epoch: int) -> Iterator[str]:
+    """Yield the roster as CSV or JSON text chunks, one row at a time.
+
+    `epoch` is the current war epoch, resolved by the caller so that a
+    settings read error surfaces before any output has been sent.
+    """
+    if fmt == "json":
+        yield "["
+        first = True
+        for row in iter_roster(epoch):
+            yield ("" if first else ",") + json.dumps(row, ensure_ascii=False)
+            first = False
+        yield "]"
+        return
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    for row in iter_roster(epoch):
+        writer.writerow([csv_safe(row[f]) for f in EXPORT_FIELDS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.getvalue():
+        yield buf.getvalue()
+
+def build_roster_export(fmt: str) -> bytes:
+    # The Bot API upload is a single multipart body and PTB's InputFile
+    # reads the whole document anyway, so the bot command cannot stream;
+    # only GET /export streams end to end.
+    return "".join(iter_roster_export(fmt, get_war_epoch())).encode("utf-8")
+
+async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(context.bot, update.effective_user.id):
+        await update.message.reply_text("🚫 Solo admins.")
+        return
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in ("csv", "json"):
+        await update.message.reply_text("❌ Usa /export [csv|json]")
+        return
+    try:
+        data = await asyncio.to_thread(build_roster_export, fmt)
+    except Exception:
+        logger.exception("Error exportando roster")
+        await update.message.reply_text("❌ Error al exportar.")
+        return
+    await update.message.reply_document(document=data, filename=f"roster.{fmt}")
+
+# ---------- Bulk import ----------
+def split_import_line(line: str) -> List[str]:
+    """Split a 'guser atk def' line on whitespace; the last two tokens are
+    atk/def so game names may contain spaces."""
+    parts = line.split()
+    return [" ".join(parts[:-2])] + parts[-2:] if len(parts) >= 3 else parts
+
+def split_import_lines(text: str, is_csv: bool) -> List[Tuple[int, List[str]]]:
+    """Split import input into (line number, [guser, atk, def]) rows.
+
+    CSV rows use the csv module, falling back to whitespace splitting for
+    single-column rows (a 'guser atk def' file); pasted lines always split
+    on whitespace.
+    """
+    rows: List[Tuple[int, List[str]]] = []
+    if is_csv:
+        for n, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+            cols = [c.strip() for c in row]
+            if len(cols) == 1:
+                cols = split_import_line(cols[0])
+            if any(cols):
+                rows.append((n, cols))
+    else:
+        for n, line in enumerate(text.splitlines(), start=1):
+            parts = split_import_line(line)
+            if parts:
+                rows.append((n, parts))
+    return rows
+
+def build_import_roster(users: List[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Index users by lowercased guser; names shared by several users map to None."""
+    roster: Dict[str, Optional[Dict[str, Any]]] = {}
+    for u in users:
+        if not u.get("guser"):
+            continue
+        key = u["guser"].lower()
+        roster[key] = None if key in roster else u
+    return roster
+
+def plan_import(rows: List[Tuple[int, List[str]]], roster: Dict[str, Optional[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Validate parsed rows against the roster from build_import_roster.
+
+    Returns the upsert payload and a per-row error report.
+    """
+    errors: List[str] = []
+    if rows and [c.lower() for c in rows[0][1]] == ["guser", "atk", "def"]:
+        rows = rows[1:]  # header
+    atks = parse_powers([r[1][1] if len(r[1]) == 3 else None for r in rows])
+    defs = parse_powers([r[1][2] if len(r[1]) == 3 else None for r in rows])
+    payload: List[Dict[str, Any]] = []
+    seen = set()
+    for (n, cols), atk, defense in zip(rows, atks, defs):
+        if len(cols) != 3:
+            errors.append(f"L{n}: formato inválido (guser atk def)")
+            continue
+        guser = cols[0]
+        key = guser.lower()
+        user = roster.get(key)
+        name = guser if len(guser) <= IMPORT_MAX_NAME else guser[:IMPORT_MAX_NAME] + "…"
+        if key not in roster:
+            errors.append(f"L{n}: {name} no está en el roster")
+        elif user is None:
+            errors.append(f"L{n}: {name} es ambiguo (varios jugadores con ese nombre)")
+        elif atk is None or defense is None:
+            errors.append(f"L{n}: {name} valor inválido")
+        elif user["uid"] in seen:
+            errors.append(f"L{n}: {name} duplicado")
+        else:
+            seen.add(user["uid"])
+            payload.append({**user, "atk": atk, "def": defense})
+    return payload, errors
+
+async def cmd_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(context.bot, update.effective_user.id):
+        await update.message.reply_text("🚫 Solo admins.")
+        return
+    doc = update.message.document
+    if doc:
+        if doc.file_size and doc.file_size > IMPORT_MAX_BYTES:
+            await update.message.reply_text("❌ Archivo demasiado grande.")
+            return
+        f = await doc.get_file()
+        text = (await f.download_as_bytearray()).decode("utf-8-sig", errors="replace")
+        is_csv = True
+    else:
+        parts = (update.message.text or "").split(maxsplit=1)
+        text = parts[1] if len(parts) > 1 else ""
+        is_csv = False
+    if not text.strip():
+        await update.message.reply_text("❌ Usa /import seguido de líneas 'guser atk def', o envía un CSV con /import como pie.")
+        return
+
+    try:
+        roster = build_import_roster([u async for u in aiter_table("users", "guser,tg,race")])
+    except Exception:
+        logger.exception("Error leyendo roster para import")
+        await update.message.reply_text("❌ Error al leer el roster.")
+        return
+    payload, errors = plan_import(split_import_lines(text, is_csv), roster)
+    if payload:
+        try:
+            supabase.table("users").upsert(payload).execute() if supabase else None
+        except Exception:
+            logger.exception("Error en upsert de import")
+            await update.message.reply_text("❌ Error al guardar. No se aplicó ningún cambio.")
+            return
+        request_leaderboard_refresh(context)
+    msg = f"✅ {len(payload)} actualizados, ❌ {len(errors)} errores."
+    if errors:
+        msg += "\n\n" + "\n".join(errors[:IMPORT_MAX_REPORT])
+        if len(errors) > IMPORT_MAX_REPORT:
+            msg += f"\n… y {len(errors) - IMPORT_MAX_REPORT} más"
+    await update.message.reply_text(msg[:4096])
+
+# ---------- Profiling ----------
+# /profile turns on, for a bounded window, a stack sampler thread plus
+# per-update timing of Supabase and Telegram calls. The sampler only looks at
+# the event-loop thread while an update is being processed and drops samples
+# where the loop is idle in select(); time spent awaiting I/O shows up in the
+# per-update Supabase/Telegram breakdown instead. When no window is open the
+# only cost is one flag check per update and one ContextVar lookup per
+# Telegram request.
+_update_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("update_trace", default=None)
+
+class UpdateProfiler:
+    def __init__(self):
+        self.active = False
+        self.stacks: Counter = Counter()
+        self.updates: List[Dict[str, Any]] = []
+        self.in_update = 0
+        self._loop_ident: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._db_pending: Dict[int, float] = {}
+
+    def start(self) -> bool:
+        """Start a window; must be called from the event-loop thread."""
+        if self.active:
+            return False
+        self._loop_ident = threading.get_ident()
+        self.stacks = Counter()
+        self.updates = []
+        self._db_pending = {}
+        self._stop.clear()
+        self._set_db_hooks(True)
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        self.active = True
+        return True
+
+    def stop(self) -> Dict[str, Any]:
+        """End the window and build the report; call it off the event loop."""
+        self.active = False
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self._set_db_hooks(False)
+        slowest = sorted(self.updates, key=lambda t: t["total_ms"], reverse=True)[:PROFILE_TOP_UPDATES]
+        collapsed = "\n".join(f"{stack} {n}" for stack, n in Counter(self.stacks).most_common())
+        return {"collapsed": collapsed, "slowest": slowest, "updates": len(self.updates), "note": PROFILE_NOTE}
+
+    def record(self, trace: Dict[str, Any]):
+        if self.active:
+            self.updates.append(trace)
+
+    def _sample(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            if not self.in_update:
+                continue
+            frame = sys._current_frames().get(self._loop_ident)
+            if frame is None or frame.f_globals.get("__name__") == "selectors":
+                continue  # loop idle, waiting for I/O
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _db_request(self, request):
+        if _update_trace.get() is not None:
+            self._db_pending[id(request)] = time.perf_counter()
+
+    def _db_response(self, response):
+        t0 = self._db_pending.pop(id(response.request), None)
+        trace = _update_trace.get()
+        if t0 is not None and trace is not None:
+            trace["supabase_ms"] += (time.perf_counter() - t0) * 1000
+            trace["supabase_calls"] += 1
+
+    def _set_db_hooks(self, enabled: bool):
+        try:
+            session = supabase.postgrest.session if supabase else None
+        except Exception:
+            session = None
+        if session is None:
+            return
+        hooks = session.event_hooks
+        for name, hook in (("request", self._db_request), ("response", self._db_response)):
+            hooks[name] = [h for h in hooks.get(name, []) if h != hook] + ([hook] if enabled else [])
+        session.event_hooks = hooks
+
+profiler = UpdateProfiler()
+
+def describe_update(update: object) -> str:
+    if isinstance(update, Update):
+        if update.message and update.message.text:
+            return update.message.text.split()[0][:64]
+        if update.callback_query:
+            return f"callback:{update.callback_query.data}"
+        return f"update:{update.update_id}"
+    return type(update).__name__
+
+class ProfilingApplication(Application):
+    async def process_update(self, update: object) -> None:
+        if not profiler.active:
+            return await super().process_update(update)
+        trace = {"update": describe_update(update), "total_ms": 0.0,
+                 "supabase_ms": 0.0, "supabase_calls": 0, "telegram_ms": 0.0, "telegram_calls": 0}
+        token = _update_trace.set(trace)
+        profiler.in_update += 1
+        t0 = time.perf_counter()
+        try:
+            return await super().process_update(update)
+        finally:
+            trace["total_ms"] = (time.perf_counter() - t0) * 1000
+            profiler.in_update -= 1
+            _update_trace.reset(token)
+            profiler.record(trace)
+
+class ProfilingRequest(HTTPXRequest):
+    async def do_request(self, *args, **kwargs):
+        trace = _update_trace.get()
+        if trace is None:
+            return await super().do_request(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            trace["telegram_ms"] += (time.perf_counter() - t0) * 1000
+            trace["telegram_calls"] += 1
+
+def format_slowest(report: Dict[str, Any]) -> str:
+    lines = [f"⏱ {report['updates']} updates perfilados ({report['note']}). Más lentos:"]
+    for t in report["slowest"]:
+        lines.append(
+            f"{t['total_ms']:.0f} ms {t['update']} — "
+            f"supabase {t['supabase_ms']:.0f} ms ({t['supabase_calls']}), "
+            f"telegram {t['telegram_ms']:.0f} ms ({t['telegram_calls']})"
+        )
+    return "\n".join(lines)[:4096]
+
+async def job_finish_profile(context: ContextTypes.DEFAULT_TYPE):
+    chat_id = context.job.data["chat_id"]
+    report = await asyncio.to_thread(profiler.stop)
+    try:
+        await context.bot.send_message(chat_id, format_slowest(report))
+        if report["collapsed"]:
+            await context.bot.send_document(chat_id, document=report["collapsed"].encode("utf-8"), filename="profile.collapsed")
+    except Exception:
+        logger.exception("Error enviando reporte de profiling")
+
+async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(context.bot, update.effective_user.id):
+        await update.message.reply_text("🚫 Solo admins.")
+        return
+    try:
+        seconds = float(context.args[0]) if context.args else 10.0
+    except ValueError:
+        await update.message.reply_text(f"❌ Usa /profile <segundos> (máx {PROFILE_MAX_SECONDS})")
+        return
+    seconds = min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+    if not context.job_queue:
+        await update.message.reply_text("❌ JobQueue no disponible; instala python-telegram-bot[job-queue].")
+        return
+    if not profiler.start():
+        await update.message.reply_text("⚠️ Ya hay un profiling en curso.")
+        return
+    # finish from a job so the window does not block update processing
+    try:
+        context.job_queue.run_once(job_finish_profile, seconds, data={"chat_id": update.effective_chat.id})
+    except Exception:
+        logger.exception("No se pudo programar el fin del profiling")
+        await asyncio.to_thread(profiler.stop)
+        await update.message.reply_text("❌ No se pudo iniciar el profiling.")
+        return
+    await update.message.reply_text(f"⏱ Profiling activo durante {seconds:.0f}s.")
+
 # ---------- Mention bot / getcom ----------
 async def mention_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.entities:
@@ -662,11 +1312,15 @@ async def mention_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /me - Ver tus datos.
 /atk - Ver ranking de ataque.
 /def - Ver ranking de defensa.
+/liveboard on|off - Ranking fijado y actualizado en vivo (admins).
 /member - Agregarte a la lista de miembros.
 /war HH:MM - Iniciar guerra (admins).
 /warlessa - Poder restante en ataque.
 /warlessd - Poder restante en defensa.
 /endwar - Finalizar guerra (admins).
+/export - Exportar roster en CSV/JSON (admins).
+/import - Importar stats en bloque 'guser atk def' o CSV (admins).
+/profile <segundos> - Perfilar el bot durante un tiempo (admins).
 /memberlist - Listar no registrados (admins).
 /delist - Gestionar miembros (admins).
 /allgato - Mencionar gatos (admins).
@@ -686,6 +1340,7 @@ async def cmd_getcom(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ("/me", "Muestra tus datos registrados (nombre, raza, ataque, defensa)."),
         ("/atk", "Muestra el ranking de ataque del clan."),
         ("/def", "Muestra el ranking de defensa del clan."),
+        ("/liveboard on|off", "(Admins) Activa o desactiva el ranking fijado que se edita en vivo."),
         ("/member", "Agrega tu UID a la lista de miembros (registro previo)."),
         ("/memberlist", "(Admins) Publica la lista de miembros no registrados."),
         ("/delist", "(Admins) Gestiona y elimina miembros desde un menú interactivo."),
@@ -693,6 +1348,9 @@ async def cmd_getcom(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ("/warlessa", "Muestra poder de ataque restante (usuarios que no enviaron tropas)."),
         ("/warlessd", "Muestra poder de defensa restante (usuarios que no enviaron tropas)."),
         ("/endwar", "(Admins) Finaliza la guerra y resetea los flags de envío."),
+        ("/export [csv|json]", "(Admins) Exporta el roster del clan como documento."),
+        ("/import", "(Admins) Actualiza stats en bloque: líneas 'guser atk def' o un CSV con /import como pie."),
+        ("/profile <segundos>", "(Admins) Perfila el manejo de updates y envía los más lentos y un flamegraph."),
         ("/sync_members", "(Admins) Mostrar miembros no registrados (limitado por Supabase)."),
         ("/allgato / allperro / allrana", "(Admins) Menciona usuarios por raza."),
         ("/cancel", "Cancela el proceso actual del usuario en el conversation handler."),
@@ -728,6 +1386,7 @@ async def handle_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
             supabase.table("members").delete().eq("uid", uid).execute() if supabase else None
         except Exception:
             logger.exception("Error borrando usuario que salió del grupo: %s", uid)
+        request_leaderboard_refresh(context)
 
 # ---------- Mention by race ----------
 async def cmd_allgato(update: Update, context: ContextTypes.DEFAULT_TYPE): 
@@ -742,11 +1401,10 @@ async def mention_race_helper(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("🚫 Solo admins.")
         return
     try:
-        res = supabase.table("users").select("tg").eq("race", race).execute() if supabase else None
-        users = res.data if res and getattr(res, "data", None) else []
+        mentions = [f"@{u['tg']}" async for u in aiter_table("users", "tg", where=lambda q: q.eq("race", race)) if u.get("tg")]
     except Exception:
-        users = []
-    mentions = [f"@{u['tg']}" for u in users if u.get("tg")]
+        logger.exception("Error leyendo usuarios de raza %s", race)
+        mentions = []
     if not mentions:
         await update.message.reply_text(f"❌ No hay usuarios de raza {race} con username para mencionar.")
         return
@@ -758,7 +1416,13 @@ async def mention_race_helper(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text(msg)
 
 # ---------- Application build & registration ----------
-tg_app = Application.builder().token(TOKEN).build()
+tg_app = (
+    Application.builder()
+    .token(TOKEN)
+    .application_class(ProfilingApplication)
+    .request(ProfilingRequest(connection_pool_size=256))
+    .build()
+)
 
 # Conversation handler
 conv = ConversationHandler(
@@ -781,6 +1445,7 @@ tg_app.add_handler(CommandHandler("start", start_group_entry, filters=filters.Ch
 tg_app.add_handler(conv)
 tg_app.add_handler(CommandHandler("atk", cmd_atk))
 tg_app.add_handler(CommandHandler("def", cmd_def))
+tg_app.add_handler(CommandHandler("liveboard", cmd_liveboard))
 tg_app.add_handler(CommandHandler("me", cmd_me))
 tg_app.add_handler(CommandHandler("member", cmd_member))
 tg_app.add_handler(CommandHandler("memberlist", cmd_memberlist))
@@ -790,6 +1455,10 @@ tg_app.add_handler(CommandHandler("warlessa", cmd_warlessa))
 tg_app.add_handler(CommandHandler("warlessd", cmd_warlessd))
 tg_app.add_handler(CommandHandler("endwar", cmd_endwar))
 tg_app.add_handler(CommandHandler("sync_members", cmd_sync_members))
+tg_app.add_handler(CommandHandler("export", cmd_export))
+tg_app.add_handler(CommandHandler("import", cmd_import))
+tg_app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import"), cmd_import))
+tg_app.add_handler(CommandHandler("profile", cmd_profile))
 tg_app.add_handler(CommandHandler("allgato", cmd_allgato))
 tg_app.add_handler(CommandHandler("allperro", cmd_allperro))
 tg_app.add_handler(CommandHandler("allrana", cmd_allrana))
@@ -814,6 +1483,42 @@ async def webhook(req: Request):
     await tg_app.update_queue.put(update)
     return {"ok": True}
 
+def require_admin_token(req: Request):
+    token = req.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="forbidden")
+
+@app.get("/export")
+def export_roster(req: Request, fmt: str = "csv"):
+    """Stream the clan roster as CSV or JSON (requires X-Admin-Token)."""
+    require_admin_token(req)
+    if fmt not in ("csv", "json"):
+        raise HTTPException(status_code=400, detail="fmt must be csv or json")
+    try:
+        epoch = get_war_epoch()
+    except Exception:
+        logger.exception("Error reading war_epoch for export")
+        raise HTTPException(status_code=503, detail="could not read war epoch")
+    media_type = "text/csv" if fmt == "csv" else "application/json"
+    return StreamingResponse(
+        iter_roster_export(fmt, epoch),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="roster.{fmt}"'},
+    )
+
+@app.post("/profile")
+async def profile(req: Request, seconds: float = 10.0):
+    """Profile update handling for `seconds` (requires X-Admin-Token)."""
+    require_admin_token(req)
+    seconds = min(max(seconds, 1.0), PROFILE_MAX_SECONDS)
+    if not profiler.start():
+        raise HTTPException(status_code=409, detail="profiling already running")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        report = await asyncio.to_thread(profiler.stop)
+    return report
+
 @app.get("/")
 async def health():
     return {"status": "ok", "bot": "Clan Helper Beta 2"}